@@ -2,6 +2,7 @@
 #import logging
 from configurations import *
 import numpy as np
+import pandas as pd
 from calculations_load import validation_data
 
 
@@ -3,198 +3,283 @@
 import numpy as np
 #import h5py
 import sys, os, glob
+from multiprocessing import Pool
 # Input data format
 from calculations_file_format_single_event import *
 # Output data format
 from configurations import *
 
-def list2array(func):
-        def func_wrapper(x, w):
-                try:
-                        x = np.array(x)
-                        w = np.array(w)
-                except:
-                        raise ValueError("cannot interpret input as numpy array...")
-                return func(x, w)
-        return func_wrapper
-
-def weighted_mean_std(x, w=None):
+def bin_events(index):
+        # event indices of every centrality bin [nl, nh) laid end to end,
+        # with the position where each bin starts; handles overlapping bins
+        counts = np.maximum(index[:,1] - index[:,0], 0)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(int)
+        events = np.arange(counts.sum()) + np.repeat(index[:,0] - starts, counts)
+        return events, starts, counts
+
+def segment_sum(x, starts, counts):
+        # sum of consecutive segments of x in a single np.add.reduceat call,
+        # a zero row is appended so that a start equal to len(x) is valid
+        pad = np.zeros((1,) + x.shape[1:], dtype=x.dtype)
+        sums = np.add.reduceat(np.concatenate([x, pad]), starts, axis=0)
+        # reduceat returns the next element rather than 0 for an empty segment
+        sums[counts == 0] = 0.
+        return sums
+
+def binned_sum(x, index):
+        events, starts, counts = bin_events(index)
+        return segment_sum(np.asarray(x)[events], starts, counts)
+
+def segment_mean_std(x, starts, counts, w=None):
+        # (weighted) mean of each consecutive segment of x, and the standard
+        # error of that mean from the effective number of events
+        # Neff = (sum w)^2/sum w^2. x may carry extra trailing axes (species,
+        # harmonics, ...). Two passes (mean, then squared deviations from it)
+        # keep the variance as accurate as a per-bin calculation.
+        extra = (1,)*(x.ndim - 1)
         if w is None:
-                Neff = x.size
-                mean = np.mean(x)
-                std = np.std(x)/np.sqrt(Neff-1.+1e-9)
+                s0 = counts.astype(float).reshape((-1,) + extra)
+                mean = segment_sum(x, starts, counts)/s0
+                dx = x - np.repeat(mean, counts, axis=0)
+                var = segment_sum(dx*dx, starts, counts)/s0
+                Neff = s0
         else:
-                Neff = np.sum(w)**2/np.sum(w**2)
-                mean = np.average(x, weights=w)
-                std = ( np.average((x-mean)**2, weights=w)/(Neff-1.+1e-9) ) **.5
+                w = w.reshape(w.shape + (1,)*(x.ndim - w.ndim))
+                s0 = segment_sum(w, starts, counts)
+                mean = segment_sum(w*x, starts, counts)/s0
+                dx = x - np.repeat(mean, counts, axis=0)
+                var = segment_sum(w*dx*dx, starts, counts)/s0
+                Neff = s0**2/segment_sum(w*w, starts, counts)
+        std = np.sqrt(var/(Neff-1.+1e-9))
         return mean, std
 
-def calculate_dNdeta(ds, exp, cen, idf):
-        Ne = len(ds)
-        cenM = np.mean(cen, axis=1)
-        index = (cen/100.*Ne).astype(int)
-        obs = np.zeros_like(cenM)
-        obs_err = np.zeros_like(cenM)
-        for i, (nl, nh) in enumerate(zip(index[:,0], index[:,1])):
-                nh = np.max([nh, nl+1])
-                obs[i], obs_err[i] = weighted_mean_std( ds[exp]['dNch_deta'][nl:nh, idf] )
+def binned_mean_std(x, index, w=None):
+        # (weighted) mean and its standard error in every centrality bin at once
+        events, starts, counts = bin_events(index)
+        x = np.asarray(x, dtype=float)[events]
+        if w is not None:
+                w = np.asarray(w, dtype=float)[events]
+        return segment_mean_std(x, starts, counts, w)
+
+def event_columns(ds, exp, idf, order=None):
+        # copy the fields read by the calculate_* functions for one delta-f
+        # option into contiguous arrays, so that the reductions stream
+        # through memory instead of striding over whole event records.
+        # If given, the events are taken in the given order; only the
+        # fields used are gathered, which keeps a memmapped ds from being
+        # read in full.
+        ev = ds[exp][:, idf]
+        def column(a):
+                return np.ascontiguousarray(a if order is None else a[order])
+        return {
+                'dNch_deta': column(ev['dNch_deta']),
+                'dET_deta': column(ev['dET_deta']),
+                'dN_dy': {s: column(ev['dN_dy'][s]) for (s, _) in species},
+                'mean_pT': {s: column(ev['mean_pT'][s]) for (s, _) in species},
+                'pT_fluct_chg': {f: column(ev['pT_fluct_chg'][f])
+                                        for f in ['N', 'sum_pT', 'sum_pT2']},
+                'flow': {f: column(ev['flow'][f]) for f in ['N', 'Qn']},
+        }
+
+def centrality_bins(cen, Ne):
+        # event ranges [nl, nh) and midpoints of the centrality bins cen (in %)
+        # for Ne events sorted by decreasing multiplicity
+        cen = np.array(cen)
+        return (cen/100.*Ne).astype(int), np.mean(cen, axis=1)
+
+def species_by_bins(bins, obs, names):
+        # the species of names with a binned observable obs+'_'+species,
+        # grouped by centrality binning so that each group is reduced once
+        groups = {}
+        for s in names:
+                if obs+'_'+s in bins:
+                        index, cenM = bins[obs+'_'+s]
+                        groups.setdefault(index.tobytes(), (index, cenM, []))[2].append(s)
+        return list(groups.values())
+
+def calculate_dNdeta(dNch_deta, index, cenM):
+        index = index.copy()
+        index[:,1] = np.maximum(index[:,1], index[:,0]+1)
+        obs, obs_err = binned_mean_std(dNch_deta, index)
         return {'Name': 'dNch_deta', 'cenM': cenM, 'pTM' : None,
                         'obs': obs, 'err': obs_err}
 
 
-def calculate_dETdeta(ds, exp, cen, idf):
-        Ne = len(ds)
-        cenM = np.mean(cen, axis=1)
-        index = (cen/100.*Ne).astype(int)
-        obs = np.zeros_like(cenM)
-        obs_err = np.zeros_like(cenM)
-        for i, (nl, nh) in enumerate(zip(index[:,0], index[:,1])):
-                obs[i], obs_err[i] = weighted_mean_std(ds[exp]['dET_deta'][nl:nh, idf])
+def calculate_dETdeta(dET_deta, index, cenM):
+        obs, obs_err = binned_mean_std(dET_deta, index)
         return {'Name': 'dNch_deta', 'cenM': cenM, 'pTM' : None,
                         'obs': obs, 'err': obs_err}
 
-def calculate_dNdy(ds, exp, cen, idf):
-        Ne = len(ds)
-        cenM = np.mean(cen, axis=1)
-        index = (cen/100.*Ne).astype(int)
-        obs = {s: np.zeros_like(cenM) for (s, _) in species}
-        obs_err = {s: np.zeros_like(cenM) for (s, _) in species}
-        for (s, _) in species:
-                for i, (nl, nh) in enumerate(zip(index[:,0], index[:,1])):
-                        obs[s][i], obs_err[s][i] = weighted_mean_std(ds[exp]['dN_dy'][s][nl:nh, idf])
+def calculate_dNdy(dN_dy, index, cenM):
+        # the species in dN_dy in a single reduction over (events, species)
+        names = list(dN_dy)
+        mean, std = binned_mean_std(np.stack([dN_dy[s] for s in names], axis=1), index)
+        obs = {s: mean[:, k] for k, s in enumerate(names)}
+        obs_err = {s: std[:, k] for k, s in enumerate(names)}
         return {'Name': 'dNch_deta', 'cenM': cenM, 'pTM' : None,
                         'obs': obs, 'err': obs_err}
 
-def calculate_mean_pT(ds, exp, cen, idf):
+def calculate_mean_pT(mean_pT, index, cenM):
         #print("Calculating mean pT")
-        Ne = len(ds)
-        cenM = np.mean(cen, axis=1)
-        index = (cen/100.*Ne).astype(int)
-        obs = {s: np.zeros_like(cenM) for (s, _) in species}
-        obs_err = {s: np.zeros_like(cenM) for (s, _) in species}
-        for (s, _) in species:
-                for i, (nl, nh) in enumerate(zip(index[:,0], index[:,1])):
-                        obs[s][i], obs_err[s][i] = weighted_mean_std(ds[exp]['mean_pT'][s][nl:nh, idf])
+        # the species in mean_pT in a single reduction over (events, species)
+        names = list(mean_pT)
+        mean, std = binned_mean_std(np.stack([mean_pT[s] for s in names], axis=1), index)
+        obs = {s: mean[:, k] for k, s in enumerate(names)}
+        obs_err = {s: std[:, k] for k, s in enumerate(names)}
         return {'Name': 'dNch_deta', 'cenM': cenM, 'pTM' : None,
                         'obs': obs, 'err': obs_err}
 
-def calculate_mean_pT_fluct(ds, exp, cen, idf):
+def calculate_mean_pT_fluct(pT_fluct, index, cenM):
+
+        events, starts, counts = bin_events(index)
+
+        N = pT_fluct['N'][events].astype(float)
+        sum_pT = pT_fluct['sum_pT'][events]
+        sum_pTsq = pT_fluct['sum_pT2'][events]
+
+        Npairs = .5*N*(N - 1)
+
+        # mean pT of each bin, bins without any pT are reported as 0
+        total_pT = segment_sum(sum_pT, starts, counts)
+        has_pT = total_pT > 0.
+        M = np.zeros_like(cenM)
+        M[has_pT] = total_pT[has_pT] / segment_sum(N, starts, counts)[has_pT]
+        Mev = np.repeat(M, counts)
+
+        # This is equivalent to the sum over pairs in Eq. (2).  It may be derived
+        # by using that, in general,
+        #
+        #   \sum_{i,j>i} a_i a_j = 1/2 [(\sum_{i} a_i)^2 - \sum_{i} a_i^2].
+        #
+        # That is, the sum over pairs (a_i, a_j) may be re-expressed in terms of
+        # the sum of a_i and sum of squares a_i^2.  Applying this to Eq. (2) and
+        # collecting terms yields the following expression.
+        # Events without pairs carry no weight and are left out; for the rest
+        # the expression is evaluated in place, without a temporary array for
+        # every operation.
+        x = np.zeros_like(Npairs)
+        pairs = Npairs > 0.
+        S, Mp = sum_pT[pairs], Mev[pairs]
+        xp = S*S
+        xp -= sum_pTsq[pairs]
+        xp *= .5
+        xp -= Mp*(N[pairs] - 1)*S
+        xp /= Npairs[pairs]
+        xp += Mp*Mp
+        x[pairs] = xp
+        meanC, stdC = segment_mean_std(x, starts, counts, Npairs)
 
-        Ne = len(ds)
-        cenM = np.mean(cen, axis=1)
-        index = (cen/100.*Ne).astype(int)
         obs = np.zeros_like(cenM)
         obs_err = np.zeros_like(cenM)
-        for (s, _) in species:
-
-                for i, (nl, nh) in enumerate(zip(index[:,0], index[:,1])):
-                        N = ds[exp]['pT_fluct_chg']['N'][nl:nh, idf]
-                        sum_pT = ds[exp]['pT_fluct_chg']['sum_pT'][nl:nh, idf]
-                        sum_pTsq = ds[exp]['pT_fluct_chg']['sum_pT2'][nl:nh, idf]
-
-
-                        Npairs = .5*N*(N - 1)
-
-                        if ( sum_pT.sum() > 0. ):
-                            M = sum_pT.sum() / N.sum()
-                            # This is equivalent to the sum over pairs in Eq. (2).  It may be derived
-                            # by using that, in general,
-                            #
-                            #   \sum_{i,j>i} a_i a_j = 1/2 [(\sum_{i} a_i)^2 - \sum_{i} a_i^2].
-                            #
-                            # That is, the sum over pairs (a_i, a_j) may be re-expressed in terms of
-                            # the sum of a_i and sum of squares a_i^2.  Applying this to Eq. (2) and
-                            # collecting terms yields the following expression.
-                            x = (.5*(sum_pT**2 - sum_pTsq) - M*(N - 1)*sum_pT + M**2*Npairs)/Npairs
-                            meanC, stdC = weighted_mean_std(x, Npairs)
-                            obs[i] = np.sqrt(meanC)/M
-                            obs_err[i] = stdC*.5/np.sqrt(meanC)/M
-                        else :
-                            obs[i] = 0.
-                            obs_err[i] = 0.
+        obs[has_pT] = np.sqrt(meanC[has_pT])/M[has_pT]
+        obs_err[has_pT] = stdC[has_pT]*.5/np.sqrt(meanC[has_pT])/M[has_pT]
 
         return {'Name': 'dNch_deta', 'cenM': cenM, 'pTM' : None,
                         'obs': obs, 'err': obs_err}
 
 
-def calculate_vn(ds, exp, cen, idf):
-        @list2array
-        def obs_and_err(qn, m):
-                w = m*(m-1.) # is this P_{M,2} in notation of Jonah's Thesis
-                if w.sum() == 0.:
-                    return 0., 0.
-                cn2 = (np.abs(qn)**2 - m)/w # is this is <2> in Jonah's thesis (p.27)
-                avg_cn2, std_avg_cn2 = weighted_mean_std(cn2, w)
-                vn = np.sqrt(avg_cn2)
-                vn_err = std_avg_cn2/2./vn
-                return vn, vn_err
-        Ne = len(ds)
-        cenM = np.mean(cen, axis=1)
-        index = (cen/100.*Ne).astype(int)
-
-        obs = np.zeros([len(cenM), Nharmonic])
-        obs_err = np.zeros([len(cenM), Nharmonic])
-
-        for i, (nl, nh) in enumerate(zip(index[:,0], index[:,1])):
-                M = ds[exp]['flow']['N'][nl:nh, idf]
-                for n in range(Nharmonic):
-                        Q = ds[exp]['flow']['Qn'][nl:nh, idf, n]
-                        obs[i,n], obs_err[i,n] = obs_and_err(Q, M)
+def calculate_vn(flow, index, cenM):
+        M = flow['N'].astype(float)
+        Q = flow['Qn'][:, :Nharmonic]
+        w = M*(M-1.) # is this P_{M,2} in notation of Jonah's Thesis
+        # is this is <2> in Jonah's thesis (p.27), for every harmonic at once;
+        # events without pairs (w = 0) do not contribute to the average
+        cn2 = np.zeros(Q.shape)
+        pairs = w > 0.
+        Qp = Q[pairs] # |Q|^2 as re^2 + im^2, np.abs would take a sqrt first
+        cn2[pairs] = (Qp.real*Qp.real + Qp.imag*Qp.imag - M[pairs, None])/w[pairs, None]
+
+        avg_cn2, std_avg_cn2 = binned_mean_std(cn2, index, w)
+        no_pairs = binned_sum(w, index) == 0.
+        avg_cn2[no_pairs] = 0.
+        obs = np.sqrt(avg_cn2)
+        obs_err = np.zeros_like(obs)
+        obs_err[~no_pairs] = std_avg_cn2[~no_pairs]/2./obs[~no_pairs]
         return {'Name': 'vn', 'cenM': cenM, 'pTM' : None,
                         'obs': obs, 'err': obs_err}
 
-def calculate_diff_vn(ds, exp, cenbins, pTbins, idf, pid='chg'):
-        Ne = len(ds)
+def calculate_diff_vn(d_flow, flow, cenbins, pTbins):
+        # d_flow holds the differential 'N' and 'Qn' arrays of one delta-f
+        # option and species, e.g. ds['d_flow_pid'][:, idf]['pion'], and
+        # flow the reference flow columns from event_columns
         pTbins = np.array(pTbins)
-        cenbins = np.array(cenbins)
-        cenM = np.mean(cenbins, axis=1)
         pTM = np.mean(pTbins, axis=1)
-        Cindex = (cenbins/100.*Ne).astype(int)
-
-        if pid == 'chg':
-                obs = 'd_flow_chg'
-                data = ds[exp][:,idf][obs]
-        else:
-                obs = 'd_flow_pid'
-                data = ds[exp][:,idf][obs][s]
+        Cindex, cenM = centrality_bins(cenbins, len(flow['N']))
 
         # need soft flow within the same centrality bin first
         # only needs Ncen x [v2, v3]
-        vnref = calculate_vn(ds, exp, cenbins, idf)
-
-        # calculate hard vn
-        vn = np.zeros([len(cenM), len(pTM), Nharmonic_diff])
-        vn_err = np.zeros([len(cenM), len(pTM), Nharmonic_diff])
-        for i, (nl, nh) in enumerate(Cindex):
-                for j, (pl, ph) in enumerate(pTbins):
-                        for n in range(Nharmonic_diff):
-                                w = data['N'][nl:nh, j] * ds[exp]['flow']['N'][nl:nh, idf]
-                                dn2 = (data['Qn'][nl:nh,j,n].conjugate() * ds[exp]['flow']['Qn'][nl:nh, idf, n]).real / w
-                                avg_dn2, std_avg_dn2 = weighted_mean_std(dn2, w)
-                                vn[i, j, n] = avg_dn2/vnref['obs'][i,n]
-                                vn_err[i, j, n] = std_avg_dn2/vnref['obs'][i,n]
+        vnref = calculate_vn(flow, Cindex, cenM)
+
+        # calculate hard vn, for all pT bins and harmonics at once;
+        # events with w = 0 do not contribute to the average
+        NpT = len(pTM)
+        w = d_flow['N'][:, :NpT] * flow['N'][:, None]
+        dn2 = (d_flow['Qn'][:, :NpT, :Nharmonic_diff].conjugate()
+               * flow['Qn'][:, None, :Nharmonic_diff]).real
+        pairs = w > 0
+        dn2[pairs] /= w[pairs, None]
+        dn2[~pairs] = 0.
+        avg_dn2, std_avg_dn2 = binned_mean_std(dn2, Cindex, w)
+        vn = avg_dn2/vnref['obs'][:, None, :Nharmonic_diff]
+        vn_err = std_avg_dn2/vnref['obs'][:, None, :Nharmonic_diff]
         return {'Name': 'vn2', 'cenM': cenM, 'pTM' : pTM,
                         'obs': vn, 'err': vn_err}
 
 def load_and_compute(inputfile, system):
 
     expt_type = expt_for_system[system]
-    entry = np.zeros(1, dtype=np.dtype(bayes_dtype))
     #res_unsort = np.fromfile(inputfile, dtype=result_dtype)
-    res_unsort = np.fromfile(inputfile, dtype=return_result_dtype(expt_type))
+    # memory-map the events, only the fields that are used get read
+    res_unsort = np.memmap(inputfile, dtype=return_result_dtype(expt_type), mode='r')
+    return compute_observables(res_unsort, system)
+
+def load_and_compute_single_design(inputdir, system):
+    # same as load_and_compute, for a design point whose events are kept
+    # one file per event in inputdir rather than catted into a single file
+    expt_type = expt_for_system[system]
+    dtype = np.dtype(return_result_dtype(expt_type))
+    files = sorted(glob.glob(os.path.join(inputdir, '*.dat')))
+    # size the output from the file sizes and fill it in place, rather than
+    # collecting a list of arrays and concatenating it. The differential
+    # flow is not used by compute_observables, so it is not copied.
+    nevents = [os.path.getsize(f) // dtype.itemsize for f in files]
+    res_unsort = np.empty(sum(nevents), dtype=return_result_dtype(expt_type, include_diff=False))
+    offset = 0
+    for f, n in zip(files, nevents):
+        if n == 0:
+            continue
+        events = np.memmap(f, dtype=dtype, mode='r', shape=n)
+        for name in res_unsort.dtype.names:
+            res_unsort[name][offset:offset+n] = events[name]
+        offset += n
+    return compute_observables(res_unsort, system)
+
+def compute_observables(res_unsort, system):
+
+    expt_type = expt_for_system[system]
+    entry = np.zeros(1, dtype=np.dtype(bayes_dtype))
+    # the binning only depends on the number of events, not on idf
+    Ne = len(res_unsort)
+    bins = {obs: centrality_bins(cen, Ne) for obs, cen in obs_cent_list[system].items()}
 
     for idf in [0,1,2,3]:
         print("----------------------")
         print("idf : " + str(idf) )
-        res = np.array(sorted(res_unsort, key=lambda x: x[expt_type][idf]['dNch_deta'], reverse=True))
-        print("Result size : " + str(res.size))
-        print("Number events w/o charged particles : " + str( (res_unsort[expt_type]['dNch_deta'][:, idf] == 0).sum() ) )
+        # sort by decreasing multiplicity; a stable sort of -dNch/deta keeps
+        # tied events in file order, as sorted(..., reverse=True) did.
+        # The key is gathered out of the event records once, into a
+        # contiguous array.
+        dNch_deta = np.ascontiguousarray(res_unsort[expt_type]['dNch_deta'][:, idf])
+        order = np.argsort(-dNch_deta, kind='stable')
+        print("Result size : " + str(order.size))
+        print("Number events w/o charged particles : " + str( (dNch_deta == 0).sum() ) )
+        ev = event_columns(res_unsort, expt_type, idf, order)
 
         # dNdeta
         tmp_obs='dNch_deta'
         try :
-            cenb=np.array(obs_cent_list[system][tmp_obs])
-            info = calculate_dNdeta(res, expt_type, cenb, idf)
+            index, cenM = bins[tmp_obs]
+            info = calculate_dNdeta(ev['dNch_deta'], index, cenM)
             entry[system][tmp_obs]['mean'][:, idf] = info['obs']
             entry[system][tmp_obs]['err'][:,idf] = info['err']
         except KeyError :
@@ -204,40 +289,37 @@ def load_and_compute(inputfile, system):
         # dETdeta
         tmp_obs='dET_deta'
         try :
-            cenb=np.array(obs_cent_list[system][tmp_obs])
-            info = calculate_dETdeta(res, expt_type, cenb, idf)
+            index, cenM = bins[tmp_obs]
+            info = calculate_dETdeta(ev['dET_deta'], index, cenM)
             entry[system][tmp_obs]['mean'][:,idf] = info['obs']
             entry[system][tmp_obs]['err'][:,idf] = info['err']
         except KeyError :
             pass
 
 
-        # dN(pid)/dy
-        for s in ['pion', 'kaon', 'proton', 'Lambda', 'Omega', 'Xi', 'd']:
-            try :
-                cenb=np.array(obs_cent_list[system]['dN_dy_'+s])
-                info = calculate_dNdy(res, expt_type, cenb, idf)
+        # dN(pid)/dy, one reduction per centrality binning
+        names = [s for s in ['pion', 'kaon', 'proton', 'Lambda', 'Omega', 'Xi', 'd']
+                 if s in ev['dN_dy']]
+        for index, cenM, group in species_by_bins(bins, 'dN_dy', names):
+            info = calculate_dNdy({s: ev['dN_dy'][s] for s in group}, index, cenM)
+            for s in group:
                 entry[system]['dN_dy_'+s]['mean'][:,idf] = info['obs'][s]
                 entry[system]['dN_dy_'+s]['err'][:,idf] = info['err'][s]
-            except KeyError :
-                pass
 
 
-        # mean-pT
-        for s in ['pion','kaon','proton', 'd']:
-            try :
-                cenb=np.array(obs_cent_list[system]['mean_pT_'+s])
-                info = calculate_mean_pT(res, expt_type, cenb, idf)
+        # mean-pT, one reduction per centrality binning
+        names = [s for s in ['pion','kaon','proton', 'd'] if s in ev['mean_pT']]
+        for index, cenM, group in species_by_bins(bins, 'mean_pT', names):
+            info = calculate_mean_pT({s: ev['mean_pT'][s] for s in group}, index, cenM)
+            for s in group:
                 entry[system]['mean_pT_'+s]['mean'][:,idf] = info['obs'][s]
                 entry[system]['mean_pT_'+s]['err'][:,idf] = info['err'][s]
-            except KeyError:
-                pass
 
         # mean-pT-fluct
         tmp_obs='pT_fluct'
         try :
-            cenb=np.array(obs_cent_list[system][tmp_obs])
-            info = calculate_mean_pT_fluct(res, expt_type, cenb, idf)
+            index, cenM = bins[tmp_obs]
+            info = calculate_mean_pT_fluct(ev['pT_fluct_chg'], index, cenM)
             entry[system][tmp_obs]['mean'][:,idf] = info['obs']
             entry[system][tmp_obs]['err'][:,idf] = info['err']
         except KeyError :
@@ -247,8 +329,8 @@ def load_and_compute(inputfile, system):
         for n in range(2,5):
             tmp_obs='v'+str(n)+'2'
             try :
-                cenb=np.array(obs_cent_list[system][tmp_obs])
-                info = calculate_vn(res, expt_type, cenb, idf)
+                index, cenM = bins[tmp_obs]
+                info = calculate_vn(ev['flow'], index, cenM)
                 entry[system][tmp_obs]['mean'][:,idf] = info['obs'][:, n-1]
                 entry[system][tmp_obs]['err'][:,idf] = info['err'][:, n-1]
             except KeyError :
@@ -256,6 +338,15 @@ def load_and_compute(inputfile, system):
 
     return entry
 
+def load_and_compute_design_pt(args):
+    # top-level wrapper so that design points can be mapped over a Pool;
+    # a design point is either a file of catted events or a directory
+    # with one file per event
+    inputpath, system = args
+    if os.path.isdir(inputpath):
+        return load_and_compute_single_design(inputpath, system)[0]
+    return load_and_compute(inputpath, system)[0]
+
 if __name__ == '__main__':
 
     system = system_strs[0]
@@ -263,19 +354,23 @@ if __name__ == '__main__':
     print("Computing observables for all design points")
     print("System = " + system)
     for folder_input, file_output, nset in zip(
-              [f_events_main, f_events_validation],
-              [f_obs_main, f_obs_validation],
-              [n_design_pts_main, n_design_pts_validation],
+              [SystemsInfo[system]["main_events_dir"], SystemsInfo[system]["validation_events_dir"]],
+              [SystemsInfo[system]["main_obs_file"], SystemsInfo[system]["validation_obs_file"]],
+              [SystemsInfo[system]["n_design"], SystemsInfo[system]["n_validation"]],
            ):
         print("\n")
         print("Averaging events in " + folder_input)
         print("##########################")
-        results = []
+        # design points are independent, average them in parallel;
+        # imap keeps the results in design point order
+        args = []
         for i in range(nset):
-            print("design pt : " + str(i))
-            filename = folder_input + "/{:d}.dat".format(i)
-            results.append(load_and_compute(filename, system)[0])
-            print("\n")
+            inputpath = folder_input + "/{:d}".format(i)
+            if not os.path.isdir(inputpath):
+                inputpath += ".dat"
+            args.append((inputpath, system))
+        with Pool() as pool:
+            results = list(pool.imap(load_and_compute_design_pt, args))
         results = np.array(results)
         print("results.shape = " + str(results.shape))
         results.tofile(file_output)
@@ -80,7 +80,10 @@ result_dtype=[
 ]
 """
 
-def return_result_dtype(expt_type):
+# include_diff=False leaves out the differential flow, which takes most of
+# each record; that dtype is for in-memory copies of the other fields and
+# does not match the layout of the event files
+def return_result_dtype(expt_type, include_diff=True):
 	result_dtype=[
 	('initial_entropy', float_t, 1),
 	('impact_parameter', float_t, 1),
@@ -118,4 +121,6 @@ def return_result_dtype(expt_type):
 	                                                                ('Qn', complex_t, [Qn_diff_NpT, Nharmonic_diff])], 1)
 	                                for (name,_) in Qn_species      ], number_of_viscous_corrections),
 	]
+	if not include_diff:
+		result_dtype = [field for field in result_dtype if field[0] != 'd_flow_pid']
 	return result_dtype
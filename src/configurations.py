@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 import os, logging
-import pandas as pd
 from pathlib import Path
 import numpy as np
 from scipy.interpolate import interp1d
@@ -73,22 +72,26 @@ num_systems = len(system_strs)
 
 #these are problematic points for Pb Pb 2760 run with 500 design points
 nan_sets_by_deltaf = {
-                        0 : set([334, 341, 377, 429, 447, 483]),
-                        1 : set([285, 334, 341, 447, 483, 495]),
-                        2 : set([209, 280, 322, 334, 341, 412, 421, 424, 429, 432, 446, 447, 453, 468, 483, 495]),
-                        3 : set([60, 232, 280, 285, 322, 324, 341, 377, 432, 447, 464, 468, 482, 483, 485, 495])
+                        0 : frozenset([334, 341, 377, 429, 447, 483]),
+                        1 : frozenset([285, 334, 341, 447, 483, 495]),
+                        2 : frozenset([209, 280, 322, 334, 341, 412, 421, 424, 429, 432, 446, 447, 453, 468, 483, 495]),
+                        3 : frozenset([60, 232, 280, 285, 322, 324, 341, 377, 432, 447, 464, 468, 482, 483, 485, 495])
                     }
 nan_design_pts_set = nan_sets_by_deltaf[idf]
 
 #nan_design_pts_set = set([60, 285, 322, 324, 341, 377, 432, 447, 464, 468, 482, 483, 495])
-unfinished_events_design_pts_set = set([289, 324, 326, 459, 462, 242, 406, 440, 123])
-strange_features_design_pts_set = set([289, 324, 440, 459, 462])
-
-delete_design_pts_set = nan_design_pts_set.union(
-                            unfinished_events_design_pts_set.union(
-                                        strange_features_design_pts_set
-                                        )
-                                    )
+unfinished_events_design_pts_set = frozenset([289, 324, 326, 459, 462, 242, 406, 440, 123])
+strange_features_design_pts_set = frozenset([289, 324, 440, 459, 462])
+
+delete_design_pts_set = nan_design_pts_set \
+                        | unfinished_events_design_pts_set \
+                        | strange_features_design_pts_set
+# the same points as a sorted index array, ready for np.delete / np.isin
+delete_design_pts_arr = np.fromiter(delete_design_pts_set, dtype=np.int64)
+delete_design_pts_arr.sort()
+# and as a mask over the 500 design points, True for those kept in training
+keep_design_pts_mask = np.ones(500, dtype=bool)
+keep_design_pts_mask[delete_design_pts_arr] = False
 
 delete_design_pts_validation_set = [10, 68, 93] # idf 0
 
@@ -110,9 +113,14 @@ class systems_setting(dict):
         super().__setitem__("validation_range_file",
             design_dir+sysdir+'//design_ranges_validation_{:s}{:s}-{:d}.dat'.format(A, B, sqrts)
             )
-        with open(design_dir+sysdir+'/design_labels_{:s}{:s}-{:d}.dat'.format(A, B, sqrts), 'r') as f:
-            labels = [r""+line[:-1] for line in f]
+        # the labels are only read on first access, see __missing__
+        self.labels_file = design_dir+sysdir+'/design_labels_{:s}{:s}-{:d}.dat'.format(A, B, sqrts)
+    def __missing__(self, key):
+        if key != 'labels':
+            raise KeyError(key)
+        labels = Path(self.labels_file).read_text().splitlines()
         super().__setitem__("labels", labels)
+        return labels
     def __setitem__(self, key, value):
         if key == 'run_id':
             super().__setitem__("main_events_dir",
@@ -138,7 +146,7 @@ if 'Pb-Pb-2760' in system_strs:
     SystemsInfo["Pb-Pb-2760"]["run_id"] = "production_500pts_Pb_Pb_2760"
     SystemsInfo["Pb-Pb-2760"]["n_design"] = 500
     SystemsInfo["Pb-Pb-2760"]["n_validation"] = 100
-    SystemsInfo["Pb-Pb-2760"]["design_remove_idx"]=list(delete_design_pts_set)
+    SystemsInfo["Pb-Pb-2760"]["design_remove_idx"]=delete_design_pts_arr
     SystemsInfo["Pb-Pb-2760"]["npc"]=10
     SystemsInfo["Pb-Pb-2760"]["MAP_obs_file"]=str(workdir/'model_calculations/MAP') + '/' + idf_label_short[idf] + '/Obs/obs_Pb-Pb-2760.dat'
 
@@ -147,7 +155,7 @@ if 'Au-Au-200' in system_strs:
     SystemsInfo["Au-Au-200"]["run_id"] = "production_500pts_Au_Au_200"
     SystemsInfo["Au-Au-200"]["n_design"] = 500
     SystemsInfo["Au-Au-200"]["n_validation"] = 100
-    SystemsInfo["Au-Au-200"]["design_remove_idx"]=list(delete_design_pts_set)
+    SystemsInfo["Au-Au-200"]["design_remove_idx"]=delete_design_pts_arr
     SystemsInfo["Au-Au-200"]["npc"] = 6
     SystemsInfo["Au-Au-200"]["MAP_obs_file"]=str(workdir/'model_calculations/MAP') + '/' + idf_label_short[idf] + '/Obs/obs_Au-Au-200.dat'
 
@@ -176,6 +184,8 @@ if validation:
                                                 n_design_pts_main // 5,
                                                 replace = False)
         delete_design_pts_set = cross_validation_pts #omit these points from training
+        keep_design_pts_mask = np.ones(n_design_pts_main, dtype=bool)
+        keep_design_pts_mask[cross_validation_pts] = False
     else:
         validation_pt = fixed_validation_pt
         print("... independent-validation, using validation_pt = " + str(validation_pt))
@@ -232,50 +242,78 @@ bayes_dtype = [    (s,
                  for s in system_strs
             ]
 
+# The means and errors of all observables of a system as one contiguous
+# array, from records of type bayes_dtype[system] (e.g. ds[system]).
+# The shape is (..., number_of_models_per_run, total number of bins, 2),
+# with the bins in obs_cent_list order and [mean, err] on the last axis
+def flat_view(arr, system_str):
+    obs_list = list(obs_cent_list[system_str].keys())
+    mean = np.concatenate([arr[obs]['mean'] for obs in obs_list], axis=-1)
+    err = np.concatenate([arr[obs]['err'] for obs in obs_list], axis=-1)
+    return np.stack([mean, err], axis=-1)
+
+#observables left out of the fit, e.g. PHENIX dN/dy proton
+excluded_obs = {
+    'Au-Au-200' : {'dN_dy_proton', 'mean_pT_proton'},
+    'Pb-Pb-2760' : {'dN_dy_Lambda', 'dN_dy_Omega', 'dN_dy_Xi'},
+}
+
 # The active ones used in Bayes analysis (MCMC)
 active_obs_list = {
-   sys: list(obs_cent_list[sys].keys()) for sys in system_strs
+   sys: [obs for obs in obs_cent_list[sys] if obs not in excluded_obs.get(sys, ())]
+   for sys in system_strs
 }
 
-#try exluding PHENIX dN/dy proton from fit
-for s in system_strs:
-    if s == 'Au-Au-200':
-        active_obs_list[s].remove('dN_dy_proton')
-        active_obs_list[s].remove('mean_pT_proton')
-
-    if s == 'Pb-Pb-2760':
-        active_obs_list[s].remove('dN_dy_Lambda')
-        active_obs_list[s].remove('dN_dy_Omega')
-        active_obs_list[s].remove('dN_dy_Xi')
-
 print("The active observable list for calibration: " + str(active_obs_list))
 
+# eta/s, zeta/s and tau_pi are written with array operations, so they
+# accept arrays (or broadcastable combinations) for any of their arguments
 def zeta_over_s(T, zmax, T0, width, asym):
     DeltaT = T - T0
-    sign = 1 if DeltaT>0 else -1
+    sign = np.where(DeltaT > 0, 1., -1.)
     x = DeltaT/(width*(1.+asym*sign))
     return zmax/(1.+x**2)
-zeta_over_s = np.vectorize(zeta_over_s)
 
 def eta_over_s(T, T_k, alow, ahigh, etas_k):
-    if T < T_k:
-        y = etas_k + alow*(T-T_k)
-    else:
-        y = etas_k + ahigh*(T-T_k)
-    if y > 0:
-        return y
-    else:
-        return 0.
-eta_over_s = np.vectorize(eta_over_s)
+    y = etas_k + np.where(T < T_k, alow, ahigh)*(T-T_k)
+    return np.maximum(y, 0.)
 
 def taupi(T, T_k, alow, ahigh, etas_k, bpi):
     return bpi*eta_over_s(T, T_k, alow, ahigh, etas_k)/T
-taupi = np.vectorize(taupi)
 
 def tau_fs(e, tau_R, alpha):
     #e stands for e_initial / e_R, dimensionless
     return tau_R * (e**alpha)
 
+# parsing a design csv is slow next to loading an npy, so the parsed values
+# (without the idx column) are kept in an npy beside it and reused for as
+# long as it is newer than the csv. The design is always returned read-only,
+# memory-mapped from the npy so it pages in on demand; callers that modify
+# it should copy first
+def read_design_file(design_file):
+    # pandas is slow to import and only needed here, so import it on use
+    import pandas as pd
+    cache = Path(design_file).with_suffix('.npy')
+    # the column names are just the csv header
+    with open(design_file, 'r') as f:
+        columns = f.readline().strip().split(',')
+    columns.remove("idx")
+    if not (cache.exists() and cache.stat().st_mtime >= os.path.getmtime(design_file)):
+        values = pd.read_csv(design_file).drop("idx", axis=1).values
+        try:
+            # write to a temporary file first, so that a concurrent reader
+            # never sees a partial cache
+            tmp = cache.with_suffix('.npy.{:d}'.format(os.getpid()))
+            with open(tmp, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp, cache)
+        except OSError:
+            logging.warning("could not cache design in {:s}".format(str(cache)))
+            # read-only all the same, as if it came from the cache
+            values.flags.writeable = False
+            return pd.DataFrame(values, columns=columns, copy=False)
+    return pd.DataFrame(np.load(cache, mmap_mode='r'), columns=columns, copy=False)
+
 # load design for other module
 def load_design(system_str, pset='main'): # or validation
     design_file = SystemsInfo[system_str]["main_design_file"] if pset == 'main' \
@@ -286,13 +324,13 @@ def load_design(system_str, pset='main'): # or validation
     print("Loading {:s} ranges from {:s}".format(pset, range_file) )
     labels = SystemsInfo[system_str]["labels"]
     # design
-    design = pd.read_csv(design_file)
-    design = design.drop("idx", axis=1)
-    print("Summary of design : ")
-    design.describe()
-    design_range = pd.read_csv(range_file)
-    design_max = design_range['max'].values
-    design_min = design_range['min'].values
+    design = read_design_file(design_file)
+    # ranges, a small param,min,max table
+    with open(range_file, 'r') as f:
+        columns = f.readline().strip().split(',')
+    design_min, design_max = np.loadtxt(range_file, delimiter=',', skiprows=1,
+                                        usecols=(columns.index('min'), columns.index('max')),
+                                        unpack=True)
     return design, design_min, design_max, labels
 
 # A specially transformed design for the emulators
@@ -314,26 +352,30 @@ def load_design(system_str, pset='main'): # or validation
 #right now this depends on the ordering of parameters
 #we should write a version instead that uses labels in case ordering changes
 
+#the non-viscous parameters kept by transform_design, and the temperatures
+#at which it evaluates eta/s and zeta/s; built once rather than per call
+transform_design_indices = np.array([0, 1, 2, 3, 4, 5, 6, 15, 16], dtype=np.intp)
+transform_design_Temperature_grid = np.linspace(0.135, 0.4, 10)
+
 def transform_design(X):
     #pop out the viscous parameters
-    indices = [0, 1, 2, 3, 4, 5, 6, 15, 16]
-    new_design_X = X[:, indices]
+    indices = transform_design_indices
 
     #now append the values of eta/s and zeta/s at various temperatures
-    num_T = 10
-    Temperature_grid = np.linspace(0.135, 0.4, num_T)
-    eta_vals = []
-    zeta_vals = []
-    for pt, T in enumerate(Temperature_grid):
-        eta_vals.append( eta_over_s(T, X[:, 7], X[:, 8], X[:, 9], X[:, 10]) )
-    for pt, T in enumerate(Temperature_grid):
-        zeta_vals.append( zeta_over_s(T, X[:, 11], X[:, 12], X[:, 13], X[:, 14]) )
-
-    eta_vals = np.array(eta_vals).T
-    zeta_vals = np.array(zeta_vals).T
-
-    new_design_X = np.concatenate( (new_design_X, eta_vals), axis=1)
-    new_design_X = np.concatenate( (new_design_X, zeta_vals), axis=1)
+    Temperature_grid = transform_design_Temperature_grid
+    num_T = len(Temperature_grid)
+    # evaluate on the whole (design point, temperature) grid at once,
+    # the parameter columns broadcasting against the temperature row
+    T = Temperature_grid[None, :]
+
+    #fill a single output array, [parameters | eta/s(T) | zeta/s(T)]
+    new_design_X = np.empty((X.shape[0], len(indices) + 2*num_T),
+                            dtype=np.result_type(X.dtype, np.float64))
+    new_design_X[:, :len(indices)] = X[:, indices]
+    new_design_X[:, len(indices):len(indices)+num_T] = \
+            eta_over_s(T, X[:, 7:8], X[:, 8:9], X[:, 9:10], X[:, 10:11])
+    new_design_X[:, len(indices)+num_T:] = \
+            zeta_over_s(T, X[:, 11:12], X[:, 12:13], X[:, 13:14], X[:, 14:15])
     return new_design_X
 
 def prepare_emu_design(system_str):
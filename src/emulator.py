@@ -99,19 +99,11 @@ class Emulator:
         # things to drop
         delete = []
         # build a matrix of dimension (num design pts) x (number of observables)
-        Y = []
-        for ipt, data in enumerate(trimmed_model_data[system_str]):
-            row = np.array([])
-            for obs in self.observables:
-                #n_bins_bayes = len(calibration_obs_cent_list[system_str][obs]) # only using these bins for calibration
-                #values = np.array(trimmed_model_data[system_str][pt, idf][obs]['mean'][:n_bins_bayes] )
-                values = np.array(data[idf][obs]['mean'])
-                if np.isnan(values).sum() > 0:
-                    print("WARNING! FOUND NAN IN MODEL DATA WHILE BUILDING EMULATOR!")
-                    print("Design pt = " + str(pt) + "; Obs = " + obs)
-                row = np.append(row, values)
-            Y.append(row)
-        Y = np.array(Y)
+        Y = flat_view(trimmed_model_data[system_str], system_str)[:, idf, :, 0]
+        for obs in self.observables:
+            for pt in np.nonzero(np.isnan(Y[:, self._slices[obs]]).any(axis=1))[0]:
+                print("WARNING! FOUND NAN IN MODEL DATA WHILE BUILDING EMULATOR!")
+                print("Design pt = " + str(pt) + "; Obs = " + obs)
         print("Y_Obs shape[Ndesign, Nobs] = " + str(Y.shape))
 
         #Principal Components
@@ -128,7 +120,7 @@ class Emulator:
         #delete undesirable data
         if len(delete_design_pts_set) > 0:
             print("Warning! Deleting " + str(len(delete_design_pts_set)) + " points from data")
-        design = np.delete(design, list(delete_design_pts_set), 0)
+        design = design[keep_design_pts_mask]
 
         ptp = design_max - design_min
         print("Design shape[Ndesign, Nparams] = " + str(design.shape))
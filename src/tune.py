@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import numpy as np
+import pandas as pd
 import matplotlib
 import dill
 #matplotlib.use('Qt5Agg')